@@ -19,18 +19,92 @@
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  
 # USA
 
-import cElementTree as ElementTree
-import vim
+try:
+  import cElementTree as ElementTree
+except ImportError:
+  try:
+    from xml.etree import cElementTree as ElementTree
+  except ImportError:
+    from xml.etree import ElementTree
+from xml.parsers import expat
+try:
+  import vim
+except ImportError:
+  # running outside vim as the daemon
+  vim = None
 import os
+import sys
 import re
 import logging
+import marshal
+import mmap
+import struct
+import bisect
+import time
+import threading
+import json
+import socket
+import tempfile
+try:
+  import Queue as queue
+except ImportError:
+  import queue
+
+try:
+  xrange
+except NameError:
+  # python 3
+  xrange = range
+
+class LogHandler(logging.Handler):
+  """This handler writes the log records from a background thread, so logging
+  never makes the tab key wait for the disk
+  """
+  def __init__(self, filename):
+    logging.Handler.__init__(self)
+    self.records = queue.Queue()
+    self.target = logging.FileHandler(filename)
+    writer = threading.Thread(target=self._write)
+    writer.daemon = True
+    writer.start()
+
+  def emit(self, record):
+    self.records.put(record)
+
+  def _write(self):
+    while True:
+      record = self.records.get()
+      try:
+        self.target.emit(record)
+      except Exception:
+        pass
 
 class Helper(object):
+  """This class does the talking with vim, one helper is shared by the whole
+  plugin so the tab options are only read again after they could have changed
+  """
   def __init__(self):
-    self.readTabs()
-    LOG_FILENAME = os.path.expanduser('~/.vim/snipper/log')
-    logging.basicConfig(filename=LOG_FILENAME,
-    level=logging.DEBUG)
+    self.tabs = None
+    self._initLogging()
+    self.variables = Variables(self)
+
+  def _initLogging(self):
+    """Logging is off unless g:snipper_log_level is set to a level name or
+    number, the log goes to g:snipper_log_file"""
+    self.logger = logging.getLogger("snipper")
+    self.logger.propagate = False
+    level = self.getVariable("snipper_log_level", "")
+    if level.isdigit():
+      level = int(level)
+    else:
+      level = logging.getLevelName(level.upper())
+    if isinstance(level, int):
+      filename = self.getVariable("snipper_log_file", "~/.vim/snipper/log")
+      self.logger.addHandler(LogHandler(os.path.expanduser(filename)))
+      self.logger.setLevel(level)
+    else:
+      self.logger.setLevel(logging.CRITICAL + 1)
+    self.debug = self.logger.isEnabledFor(logging.DEBUG)
 
   def readTabs(self):
     if vim.eval("&expandtab"):
@@ -42,14 +116,31 @@ class Helper(object):
     else:
       tab = "\t"
       tabno = int(vim.eval("&tabstop"))
-    self.tab = tab
-    self.tabno = tabno
+    self.tabs = (tab, tabno)
+
+  def invalidate(self):
+    """Forgets the tab options, called when they are set or the buffer
+    changes"""
+    self.tabs = None
+
+  def _getTab(self):
+    if self.tabs is None:
+      self.readTabs()
+    return self.tabs[0]
+
+  def _getTabno(self):
+    if self.tabs is None:
+      self.readTabs()
+    return self.tabs[1]
+
+  tab = property(_getTab)
+  tabno = property(_getTabno)
 
   def convertTabs(self, line):
     return line.replace("\t", self.tab)
 
   def addTabs(self, line, startpos):
-    nb = startpos / self.tabno + 1
+    nb = startpos // self.tabno + 1
     tab = "".join([self.tab for tab in xrange(nb)])
     return tab + line
 
@@ -59,11 +150,72 @@ class Helper(object):
   def getBuffer(self):
     return vim.current.buffer
 
+  def let(self, name, value):
+    """Sets the vim variable name to value, value can be made of lists,
+    tuples, dicts, strings and numbers"""
+    vim.command("let %s = %s" % (name, self._toVim(value)))
+
+  def _toVim(self, value):
+    if isinstance(value, dict):
+      items = ["%s: %s" % (self._toVim(k), self._toVim(v))
+        for (k, v) in value.items()]
+      return "{" + ", ".join(items) + "}"
+    elif isinstance(value, (list, tuple)):
+      return "[" + ", ".join([self._toVim(v) for v in value]) + "]"
+    elif isinstance(value, int):
+      return str(int(value))
+    else:
+      value = self.encode(value).replace("'", "''").replace("\n", " ")
+      return "'" + value + "'"
+
+  def encode(self, text):
+    """Returns text as a str, unicode is encoded as utf-8"""
+    if not isinstance(text, str):
+      text = text.encode("utf-8")
+    return text
+
+  def getVariable(self, name, default):
+    """Returns the value of the global vim variable name or default if it is
+    not set"""
+    if vim.eval('exists("g:%s")' % name) == "1":
+      return vim.eval("g:" + name)
+    return default
+
   def redraw(self):
     vim.command("redraw")
 
-  def log(self, message):
-    logging.debug(message)
+  def setMirroring(self, mirroring):
+    """Tells vim if the typed text has to be copied to mirrors"""
+    if mirroring:
+      vim.command("let b:snipper_mirror = 1")
+    else:
+      vim.command("unlet! b:snipper_mirror")
+
+  def setActive(self, active):
+    """Tells vim if the buffer has an active template, every tab goes to
+    snipper while it has one"""
+    if active:
+      vim.command("let b:snipper_active = 1")
+    else:
+      vim.command("unlet! b:snipper_active")
+
+  def setTriggers(self, filetype, triggers):
+    """Tells vim the triggers of filetype, a tab after another word is left
+    to vim. With None as triggers vim asks snipper again"""
+    name = "g:snipper_triggers[%s]" % self._toVim(filetype)
+    if triggers is None:
+      vim.command("unlet! " + name)
+    else:
+      self.let(name, dict.fromkeys(triggers, 1))
+
+  def log(self, message, *args):
+    """Logs message % args, the message is only built when debugging"""
+    if self.debug:
+      self.logger.debug(message, *args)
+
+  def error(self, message, *args):
+    """Logs message % args as an error"""
+    self.logger.error(message, *args)
 
   def insertTab(self):
     """Insert a tab"""
@@ -91,6 +243,97 @@ class Helper(object):
     return col
 
 
+class Variables(object):
+  """This class fills in the built in placeholders like ${date} when a
+  template gets expanded. Every value is asked once for each expansion and
+  the values that can not change are kept for the whole session
+  """
+  def __init__(self, helper):
+    self.helper = helper
+    self.resolvers = {}
+    self.session = {}
+    self.register("date", self._date)
+    self.register("filename", self._filename)
+    self.register("selection", self._selection)
+    self.register("author", self._author, True)
+    self.register("clipboard", self._clipboard)
+
+  def register(self, name, resolver, session=False):
+    """Makes ${name} a built in placeholder
+    @param resolver: a function without arguments returning the value
+    @param session: True if the value is the same for the whole session
+    """
+    self.resolvers["${%s}" % name] = (resolver, session)
+
+  def __contains__(self, placeholder):
+    return placeholder in self.resolvers
+
+  def resolve(self, placeholder, values):
+    """Returns the value of placeholder
+    @param values: the values already asked for this expansion
+    """
+    try:
+      return values[placeholder]
+    except KeyError:
+      pass
+    (resolver, session) = self.resolvers[placeholder]
+    if session:
+      if placeholder not in self.session:
+        self.session[placeholder] = resolver()
+      value = self.session[placeholder]
+    else:
+      value = resolver()
+    values[placeholder] = value
+    return value
+
+  def _date(self):
+    return time.strftime(self.helper.getVariable("snipper_date_format",
+      "%Y-%m-%d"))
+
+  def _filename(self):
+    return vim.eval('expand("%:t")')
+
+  def _author(self):
+    return self.helper.getVariable("snipper_author",
+      os.environ.get("USER", ""))
+
+  def _clipboard(self):
+    return vim.eval("@+")
+
+  def _selection(self):
+    """Returns the text of the last visual selection in the buffer"""
+    start = [int(k) for k in vim.eval("getpos(\"'<\")")]
+    end = [int(k) for k in vim.eval("getpos(\"'>\")")]
+    if start[1] == 0 or end[1] == 0:
+      return ""
+    lines = vim.current.buffer[start[1]-1:end[1]]
+    mode = vim.eval("visualmode()")
+    if mode == "v":
+      lines[-1] = self._slice(lines[-1], 1, end[2])
+      lines[0] = self._slice(lines[0], start[2], None)
+    elif mode != "V":
+      lines = [self._slice(line, start[2], end[2]) for line in lines]
+    return "\n".join(lines)
+
+  @staticmethod
+  def _slice(line, first, last):
+    """Returns the part of line from the character at the byte column first
+    up to and with the character at the byte column last, the columns of
+    getpos count bytes and python 3 lines count characters
+    @param last: None for the end of the line
+    """
+    text = line
+    if isinstance(text, bytes):
+      text = text.decode("utf-8", "replace")
+    data = text.encode("utf-8")
+    first = len(data[:first-1].decode("utf-8", "replace"))
+    if last is not None:
+      last = len(data[:last-1].decode("utf-8", "replace")) + 1
+    text = text[first:last]
+    if isinstance(line, bytes):
+      return text.encode("utf-8")
+    return text
+
 class IncorrectPlaceholderException(Exception):
   pass
 
@@ -112,22 +355,42 @@ class NoWordFoundException(Exception):
   pass
 
 class Placeholder(object):
-  """This class contains a placeholder
+  """This class contains a placeholder, a template makes one for every
+  placeholder it expands so the attributes are slots
   @invar  Every placeholder has a placeholder that matches with the strPat
   """
+  __slots__ = ("placeholder", "row", "col", "text", "mirrors")
   strPat = r'\${[\w| _.-]*}'
   vimPat = r'${[a-zA-Z_.-]*}'
   cursor = "${cursor}"
   pattern = re.compile(strPat)
 
-  def __init__(self, placeholder):
+  def __init__(self, placeholder, row=-1, col=-1):
     """Create a new placeholder
     @param  placeholder
+    @param  row: the buffer line the placeholder was last seen on
+    @param  col: the column the placeholder was last seen on
     """
     if self._correctPlaceholder(placeholder):
       self.placeholder = placeholder
     else:
       raise IncorrectPlaceholderException
+    self.row = row
+    self.col = col
+    self.text = placeholder
+    self.mirrors = []
+
+  @classmethod
+  def compiled(cls, placeholder, row, col):
+    """Creates a placeholder that was already matched when its template was
+    read, so it is not tested again"""
+    self = object.__new__(cls)
+    self.placeholder = placeholder
+    self.row = row
+    self.col = col
+    self.text = placeholder
+    self.mirrors = []
+    return self
 
   def _correctPlaceholder(self,placeholder):
     """Test if the placeholder fits the strPat"""
@@ -140,17 +403,6 @@ class Placeholder(object):
     """Returns the value of the placeholder"""
     return self.placeholder.strip("$").strip("{").strip("}")
 
-  def __cmp__(self, other):
-    """Compares placeholders with each other, the cursor must the last in the
-    list, else the position may not change
-    """
-    if self.placeholder == Placeholder.cursor:
-      return 1
-    elif other.placeholder == Placeholder.cursor:
-      return -1
-    else:
-      return 0
-
   def __len__(self):
     return len(self.placeholder)
 
@@ -160,6 +412,720 @@ class Placeholder(object):
   def __repr__(self):
     return str(self)
 
+class TemplateFile(object):
+  """This class reads the templates of one xml file, the parsed templates are
+  kept in a cache file beside the xml file and are only parsed again when the
+  xml file or the tab settings change. A lazy file only reads the triggers,
+  a template is read from the xml file when it is used
+  """
+  version = 4
+  extension = ".cache"
+
+  def __init__(self, path, tab, lazy=False):
+    """Creates a new TemplateFile
+    @param path: the xml file with the templates
+    @param tab: the text that replaces a tab in the templates
+    @param lazy: True to only read the triggers
+    """
+    self.path = path
+    self.tab = tab
+    self.lazy = lazy
+    self.cache = path + TemplateFile.extension
+
+  def read(self):
+    """Returns a dict with the trigger as key and the compiled template
+    [description, lines, placeholders] as value, see _compile. The values
+    of a lazy file are LazyTemplates"""
+    stat = os.stat(self.path)
+    key = (TemplateFile.version, stat.st_mtime, stat.st_size, self.tab,
+      self.lazy)
+    templates = self._readCache(key)
+    if templates is None:
+      if self.lazy:
+        templates = self._index()
+      else:
+        templates = self._parse()
+      self._writeCache(key, templates)
+    if self.lazy:
+      for (trigger, (description, start, end)) in templates.items():
+        templates[trigger] = LazyTemplate(self, trigger, description, start,
+          end)
+    return templates
+
+  def load(self, trigger, start, end):
+    """Returns the compiled template of trigger from the bytes start up to
+    end of the xml file, the whole file is parsed when the entry is not
+    there any more"""
+    xml = open(self.path, "rb")
+    try:
+      xml.seek(start)
+      fragment = xml.read(end - start) + "</entry>".encode("ascii")
+    finally:
+      xml.close()
+    try:
+      entry = ElementTree.fromstring(fragment)
+      if entry.tag == "entry" and entry.find("trigger").text == trigger:
+        return self._entry(entry)
+    except (SyntaxError, AttributeError):
+      # the file changed since it was indexed
+      pass
+    return self._parse()[trigger]
+
+  def _parse(self):
+    """Reads the templates one entry at a time, the entries are dropped once
+    they are compiled so the document is never kept as a whole"""
+    templates = {}
+    root = None
+    for (event, element) in ElementTree.iterparse(self.path,
+      ("start", "end")):
+      if root is None:
+        root = element
+      elif event == "end" and element.tag == "entry":
+        templates[element.find("trigger").text] = self._entry(element)
+        root.clear()
+    return templates
+
+  def _entry(self, entry):
+    """Returns the compiled template of the entry element"""
+    template = entry.find("template").text.replace("\t", self.tab)
+    lines = template.split("\n")
+    description = entry.find("description").text or ""
+    return [description, lines, self._compile(lines)]
+
+  def _index(self):
+    """Returns a dict with the trigger as key and (description, start, end)
+    as value, start and end are the bytes of the entry up to its end tag.
+    The description is kept for completion and listing"""
+    index = {}
+    entry = {}
+    text = []
+    parser = expat.ParserCreate()
+    parser.buffer_text = True
+    def start(name, attributes):
+      if name == "entry":
+        entry.clear()
+        entry["start"] = parser.CurrentByteIndex
+      del text[:]
+    def end(name):
+      if name == "entry":
+        index[entry["trigger"]] = (entry.get("description", ""),
+          entry["start"], parser.CurrentByteIndex)
+      elif name in ("trigger", "description"):
+        entry[name] = "".join(text)
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    parser.CharacterDataHandler = text.append
+    xml = open(self.path, "rb")
+    try:
+      parser.ParseFile(xml)
+    finally:
+      xml.close()
+    return index
+
+  def _compile(self, lines):
+    """Returns the placeholders in the template lines as (line, column,
+    placeholder) tuples relative to the template, in the order they are
+    visited, the cursors come last"""
+    placeholders = []
+    cursors = []
+    for lineno, line in enumerate(lines):
+      for found in Placeholder.pattern.finditer(line):
+        if found.group() == Placeholder.cursor:
+          cursors.append((lineno, found.start(), found.group()))
+        else:
+          placeholders.append((lineno, found.start(), found.group()))
+    return placeholders + cursors
+
+  def _readCache(self, key):
+    """Returns the cached templates or None if the cache is missing or stale"""
+    try:
+      cache = open(self.cache, 'rb')
+      try:
+        (cached, templates) = marshal.loads(cache.read())
+      finally:
+        cache.close()
+    except Exception:
+      return None
+    if cached != key:
+      return None
+    return templates
+
+  @staticmethod
+  def temporary(path):
+    """Returns the name to write path under before it is renamed, one for
+    every thread, the preload thread and vim may write the same file"""
+    return "%s.%d.%d" % (path, os.getpid(), threading.current_thread().ident)
+
+  def _writeCache(self, key, templates):
+    """Writes the cache, a template folder that is not writable just means
+    there is no cache"""
+    tmp = TemplateFile.temporary(self.cache)
+    try:
+      cache = open(tmp, 'wb')
+      try:
+        cache.write(marshal.dumps((key, templates)))
+      finally:
+        cache.close()
+      os.rename(tmp, self.cache)
+    except (IOError, OSError):
+      try:
+        os.remove(tmp)
+      except OSError:
+        pass
+
+class TemplateProxy(object):
+  """This class stands in for a compiled template [description, lines,
+  placeholders] that is only fetched when it is first used, subclasses
+  supply _fetch. A description known beforehand is answered without a fetch
+  """
+  __slots__ = ("description", "template")
+
+  def __init__(self, description=None):
+    self.description = description
+    self.template = None
+
+  def _fetch(self):
+    """Returns the compiled template, only called once"""
+    raise NotImplementedError()
+
+  def load(self):
+    """Returns the compiled template [description, lines, placeholders]"""
+    if self.template is None:
+      self.template = self._fetch()
+    return self.template
+
+  def __getitem__(self, index):
+    if index == 0 and self.description is not None:
+      return self.description
+    return self.load()[index]
+
+  def __iter__(self):
+    return iter(self.load())
+
+  def __len__(self):
+    return 3
+
+class LazyTemplate(TemplateProxy):
+  """This class stands in for a template of a lazy TemplateFile, it reads
+  the template from the file when the template is first used
+  """
+  __slots__ = ("file", "trigger", "start", "end")
+
+  def __init__(self, file, trigger, description, start, end):
+    TemplateProxy.__init__(self, description)
+    self.file = file
+    self.trigger = trigger
+    self.start = start
+    self.end = end
+
+  def _fetch(self):
+    return self.file.load(self.trigger, self.start, self.end)
+
+class SnippetStore(object):
+  """This class keeps the compiled templates of one xml file in a binary
+  store beside it, the store is memory mapped and only its triggers and the
+  offsets of their templates are read. A template is decoded when it is
+  used, so vims on one host share the pages of the store
+  """
+  version = 2
+  extension = ".store"
+
+  def __init__(self, path, tab):
+    """Creates a new SnippetStore
+    @param path: the xml file with the templates
+    @param tab: the text that replaces a tab in the templates
+    """
+    self.path = path
+    self.tab = tab
+    self.store = path + SnippetStore.extension
+    self.map = None
+    self.base = 0
+
+  def read(self):
+    """Returns a dict with the trigger as key and a StoredTemplate as value,
+    the store is built from the xml file when it is missing or stale. A
+    template folder that is not writable has no store, its templates are
+    read by TemplateFile"""
+    stat = os.stat(self.path)
+    key = (SnippetStore.version, stat.st_mtime, stat.st_size, self.tab)
+    index = self._open(key)
+    if index is None:
+      try:
+        self._build(key)
+      except (IOError, OSError):
+        pass
+      index = self._open(key)
+    if index is None:
+      return TemplateFile(self.path, self.tab).read()
+    templates = {}
+    for (trigger, (start, end)) in index.items():
+      templates[trigger] = StoredTemplate(self, start, end)
+    return templates
+
+  def load(self, start, end):
+    """Returns the compiled template stored from start up to end"""
+    return marshal.loads(self.map[self.base+start:self.base+end])
+
+  def _open(self, key):
+    """Maps the store and returns its index, None if the store is missing
+    or stale"""
+    try:
+      store = open(self.store, "rb")
+      try:
+        map = mmap.mmap(store.fileno(), 0, access=mmap.ACCESS_READ)
+      finally:
+        store.close()
+    except (IOError, OSError, ValueError):
+      return None
+    try:
+      (length,) = struct.unpack("<I", map[:4])
+      (stored, index) = marshal.loads(map[4:4+length])
+    except Exception:
+      stored = None
+    if stored != key:
+      map.close()
+      return None
+    self.map = map
+    self.base = 4 + length
+    return index
+
+  def _build(self, key):
+    """Writes the store: the length of the index, the index with the offsets
+    of the templates and the marshalled templates. The store is replaced by
+    a rename, so a vim that still maps the old store keeps reading it"""
+    templates = TemplateFile(self.path, self.tab)._parse()
+    index = {}
+    records = []
+    offset = 0
+    for trigger in sorted(templates):
+      record = marshal.dumps(templates[trigger])
+      index[trigger] = (offset, offset + len(record))
+      records.append(record)
+      offset += len(record)
+    header = marshal.dumps((key, index))
+    tmp = TemplateFile.temporary(self.store)
+    try:
+      store = open(tmp, "wb")
+      try:
+        store.write(struct.pack("<I", len(header)))
+        store.write(header)
+        for record in records:
+          store.write(record)
+      finally:
+        store.close()
+      os.rename(tmp, self.store)
+    except (IOError, OSError):
+      try:
+        os.remove(tmp)
+      except OSError:
+        pass
+      raise
+
+class StoredTemplate(TemplateProxy):
+  """This class stands in for a template of a SnippetStore, the template is
+  decoded from the store when it is first used
+  """
+  __slots__ = ("store", "start", "end")
+
+  def __init__(self, store, start, end):
+    TemplateProxy.__init__(self)
+    self.store = store
+    self.start = start
+    self.end = end
+
+  def _fetch(self):
+    return self.store.load(self.start, self.end)
+
+class TriggerIndex(object):
+  """This class keeps the triggers of a buffer sorted, so all the triggers
+  starting with a prefix are found with a binary search, and the length of
+  the longest trigger, so a trigger is looked for in that many characters
+  """
+  def __init__(self, triggers):
+    self.triggers = sorted(triggers)
+    self.longest = max([len(k) for k in self.triggers] or [0])
+
+  def complete(self, prefix):
+    """Returns the sorted triggers that start with prefix"""
+    found = []
+    for k in range(bisect.bisect_left(self.triggers, prefix),
+      len(self.triggers)):
+      if not self.triggers[k].startswith(prefix):
+        break
+      found.append(self.triggers[k])
+    return found
+
+class Catalog(object):
+  """This class knows all the template files in a folder, every file is
+  known by its name in front of -templates.xml in lower case, vim filetypes
+  with another name are mapped on these names by aliases and the templates
+  of one file can extend the templates of other files
+  """
+  suffix = "-templates.xml"
+  aliases = {"cpp": "c", "eruby": "ror", "plaintex": "latex", "tex": "latex",
+    "xhtml": "html"}
+  extends = {"java": ["c"], "ror": ["ruby"]}
+
+  def __init__(self, folder, aliases={}, extends={}, lazy=False,
+    store=False):
+    """Creates a new Catalog
+    @param folder: the folder with the template files
+    @param aliases: extra filetype to name mappings
+    @param extends: extra name to list of names mappings
+    @param lazy: True to read a template only when it is used
+    @param store: True to map the templates from a SnippetStore
+    """
+    self.folder = folder
+    self.lazy = lazy
+    self.store = store
+    self.aliases = dict(Catalog.aliases)
+    self.aliases.update(aliases)
+    self.extends = dict(Catalog.extends)
+    self.extends.update(extends)
+    self.files = self._readFiles()
+    self.parsed = {}
+    self.loading = {}
+    self.stamps = {}
+
+  def _readFiles(self):
+    """reads all the template files, returns a dict with the name as key and
+    the file as value"""
+    files = {}
+    for file in os.listdir(self.folder):
+      if file.lower().endswith(Catalog.suffix):
+        files[file[:-len(Catalog.suffix)].lower()] = file
+      elif file.endswith(".xml"):
+        files[file[:-len(".xml")].lower()] = file
+    return files
+
+  def names(self):
+    """Returns the sorted names of all the template files"""
+    return sorted(self.files.keys())
+
+  def title(self, name):
+    """Returns the name as it is written in the file name"""
+    return self.files[name][:len(name)]
+
+  def resolve(self, filetype):
+    """Returns the name of the templates of filetype
+    @raises NoTemplateFoundException
+    """
+    name = filetype.lower()
+    name = self.aliases.get(name, name)
+    if name not in self.files:
+      raise NoTemplateFoundException()
+    return name
+
+  def preload(self, tab):
+    """Starts reading all the template files in a background thread, reading
+    a file that is not done yet waits for it"""
+    for name in self.files:
+      self.loading[(name, tab)] = threading.Event()
+    worker = threading.Thread(target=self._preload, args=(tab,))
+    worker.daemon = True
+    worker.start()
+
+  def _preload(self, tab):
+    for name in self.names():
+      key = (name, tab)
+      try:
+        self._parse(name, tab)
+      except Exception:
+        # read fails again on the main thread, where the error is seen
+        pass
+      self.loading.pop(key).set()
+
+  def read(self, name, tab):
+    """Returns the templates of the file with name, every file is only parsed
+    once for every tab"""
+    loading = self.loading.get((name, tab))
+    if loading is not None:
+      loading.wait()
+    try:
+      return self.parsed[(name, tab)]
+    except KeyError:
+      return self._parse(name, tab)
+
+  def _parse(self, name, tab):
+    self.stamps[name] = self._stamp(name)
+    path = os.path.join(self.folder, self.files[name])
+    if self.store:
+      templates = SnippetStore(path, tab).read()
+    else:
+      templates = TemplateFile(path, tab, self.lazy).read()
+    self.parsed[(name, tab)] = templates
+    return templates
+
+  def _stamp(self, name):
+    """Returns what tells if the file with name changed, None if it is gone"""
+    try:
+      stat = os.stat(os.path.join(self.folder, self.files[name]))
+    except OSError:
+      return None
+    return (stat.st_mtime, stat.st_size, stat.st_ino)
+
+  def reload(self):
+    """Forgets the templates of the files that changed since they were read
+    and looks for new files, returns the names that changed"""
+    changed = []
+    for name in list(self.stamps.keys()):
+      if self._stamp(name) != self.stamps[name]:
+        changed.append(name)
+        del self.stamps[name]
+        for key in list(self.parsed.keys()):
+          if key[0] == name:
+            del self.parsed[key]
+    files = self._readFiles()
+    for name in set(files.keys()) ^ set(self.files.keys()):
+      changed.append(name)
+    self.files = files
+    return changed
+
+  def getTemplates(self, filetype, tab):
+    """Returns the templates of filetype together with the templates it
+    extends, its own templates win
+    @raises NoTemplateFoundException
+    """
+    templates = {}
+    for name in self.lineage(filetype):
+      templates.update(self.read(name, tab))
+    return templates
+
+  def lineage(self, filetype):
+    """Returns the names of the files used by filetype
+    @raises NoTemplateFoundException
+    """
+    return self._lineage(self.resolve(filetype), [])
+
+  def _lineage(self, name, seen):
+    """Returns name after the names it extends, each name only once"""
+    seen.append(name)
+    lineage = []
+    for parent in self.extends.get(name, []):
+      if parent in self.files and parent not in seen:
+        lineage.extend(self._lineage(parent, seen))
+    lineage.append(name)
+    return lineage
+
+class RemoteCatalog(Catalog):
+  """This class is a Catalog that asks the snipper daemon for the templates,
+  the daemon reads every template file once for all the vims on the host.
+  When there is no daemon, or it goes away, the templates are read in
+  process like a Catalog does
+  """
+  timeout = 1.0
+
+  def __init__(self, path, folder, aliases={}, extends={}, lazy=False,
+    store=False):
+    """Creates a new RemoteCatalog
+    @param path: the unix socket of the daemon
+    the other parameters are those of Catalog, lazy and store are used when
+    the templates are read in process
+    """
+    self.path = path
+    self.connection = None
+    self.reader = None
+    self.local = False
+    Catalog.__init__(self, folder, aliases, extends, lazy, store)
+
+  def preload(self, tab):
+    """Only reads in process, the daemon has the templates already"""
+    if self.local:
+      Catalog.preload(self, tab)
+
+  def _parse(self, name, tab):
+    self.stamps[name] = self._stamp(name)
+    answer = self._request({"op": "read", "name": name, "tab": tab})
+    if answer is None or "templates" not in answer:
+      return Catalog._parse(self, name, tab)
+    templates = {}
+    for (trigger, description) in answer["templates"].items():
+      templates[trigger] = RemoteTemplate(self, name, tab, trigger,
+        description)
+    self.parsed[(name, tab)] = templates
+    return templates
+
+  def template(self, name, tab, trigger):
+    """Returns the compiled template of trigger in the file with name, read
+    in process when the daemon is gone
+    @raises KeyError: if there is no such template
+    """
+    answer = self._request({"op": "template", "name": name, "tab": tab,
+      "trigger": trigger})
+    if answer is None:
+      return self.read(name, tab)[trigger]
+    if "template" not in answer:
+      raise KeyError(trigger)
+    (description, lines, placeholders) = answer["template"]
+    return [description, lines, [tuple(k) for k in placeholders]]
+
+  def _request(self, request):
+    """Sends request to the daemon and returns its answer, None if there is
+    no daemon. From then on the templates are read in process, every file
+    once more"""
+    if self.local:
+      return None
+    request["folder"] = self.folder
+    try:
+      if self.connection is None:
+        if os.stat(self.path).st_uid != os.getuid():
+          # someone else's daemon, its templates are not to be trusted
+          raise OSError("%s is not owned by the user" % self.path)
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.settimeout(RemoteCatalog.timeout)
+        self.connection = connection
+        connection.connect(self.path)
+        self.reader = connection.makefile("rb")
+      self.connection.sendall((json.dumps(request) + "\n").encode("utf-8"))
+      answer = json.loads(self.reader.readline().decode("utf-8"))
+    except (EnvironmentError, ValueError, AttributeError):
+      self._close()
+      self.local = True
+      # forget the templates of the daemon, read parses the files again
+      self.parsed = {}
+      return None
+    return self._native(answer)
+
+  def _close(self):
+    for closing in (self.reader, self.connection):
+      try:
+        if closing is not None:
+          closing.close()
+      except EnvironmentError:
+        pass
+    self.connection = None
+    self.reader = None
+
+  def _native(self, value):
+    """Returns value with the unicode of json as str, python 2 vims want
+    str"""
+    if isinstance(value, dict):
+      return dict([(self._native(k), self._native(v))
+        for (k, v) in value.items()])
+    elif isinstance(value, list):
+      return [self._native(k) for k in value]
+    elif str is bytes and isinstance(value, type(u"")):
+      return value.encode("utf-8")
+    return value
+
+class RemoteTemplate(TemplateProxy):
+  """This class stands in for a template of the daemon, the template is
+  asked for when it is first used
+  """
+  __slots__ = ("catalog", "name", "tab", "trigger")
+
+  def __init__(self, catalog, name, tab, trigger, description):
+    TemplateProxy.__init__(self, description)
+    self.catalog = catalog
+    self.name = name
+    self.tab = tab
+    self.trigger = trigger
+
+  def _fetch(self):
+    return self.catalog.template(self.name, self.tab, self.trigger)
+
+class Daemon(object):
+  """This class is the snipper daemon, it reads the template files for all
+  the vims on the host and answers them over a unix socket. Every request
+  and answer is one line of json:
+  {"op": "read", "folder": f, "name": n, "tab": t} answers the descriptions
+  of the templates of a file as {"templates": {trigger: description}}
+  {"op": "template", ... "trigger": k} answers {"template": template}
+  A file that changed is read again before it is answered
+  """
+  def __init__(self, path):
+    self.path = path
+    self.catalogs = {}
+    self.lock = threading.Lock()
+
+  @staticmethod
+  def defaultPath():
+    """Returns the socket of the daemon of the user, in $XDG_RUNTIME_DIR or
+    else in a directory of the user in the temporary directory"""
+    runtime = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime:
+      return os.path.join(runtime, "snipper.sock")
+    return os.path.join(tempfile.gettempdir(), "snipper-%d" % os.getuid(),
+      "snipper.sock")
+
+  def serve(self):
+    """Answers the vims until the daemon is killed, every vim gets its own
+    thread. The socket has to be in a directory of the user that nobody
+    else can write in, so nobody else can put a socket there"""
+    folder = os.path.dirname(os.path.abspath(self.path))
+    if not os.path.isdir(folder):
+      os.makedirs(folder, 0o700)
+    stat = os.stat(folder)
+    if stat.st_uid != os.getuid() or stat.st_mode & 0o022:
+      sys.exit("%s is not a private directory of the user" % folder)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+      server.connect(self.path)
+      server.close()
+      sys.exit("a snipper daemon already listens on %s" % self.path)
+    except EnvironmentError:
+      pass
+    if os.path.exists(self.path):
+      os.remove(self.path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    mask = os.umask(0o077)
+    try:
+      server.bind(self.path)
+    finally:
+      os.umask(mask)
+    server.listen(16)
+    while True:
+      (connection, address) = server.accept()
+      worker = threading.Thread(target=self._serve, args=(connection,))
+      worker.daemon = True
+      worker.start()
+
+  def _serve(self, connection):
+    reader = connection.makefile("rb")
+    try:
+      try:
+        for line in reader:
+          try:
+            answer = self.answer(json.loads(line.decode("utf-8")))
+          except Exception:
+            answer = {"error": str(sys.exc_info()[1])}
+          connection.sendall((json.dumps(answer) + "\n").encode("utf-8"))
+      except EnvironmentError:
+        pass
+    finally:
+      reader.close()
+      connection.close()
+
+  def answer(self, request):
+    """Returns the answer to request"""
+    self.lock.acquire()
+    try:
+      catalog = self.catalogs.get(request["folder"])
+      if catalog is None:
+        catalog = self.catalogs[request["folder"]] = Catalog(request["folder"])
+      name = request["name"]
+      if name not in catalog.files or \
+        catalog._stamp(name) != catalog.stamps.get(name):
+        catalog.reload()
+      templates = catalog.read(name, request["tab"])
+      if request["op"] == "read":
+        return {"templates": dict([(trigger, template[0])
+          for (trigger, template) in templates.items()])}
+      elif request["op"] == "template":
+        return {"template": templates[request["trigger"]]}
+      raise ValueError("unknown op %s" % request["op"])
+    finally:
+      self.lock.release()
+
+  @staticmethod
+  def main(args):
+    """Starts the daemon, python snipper.py [--socket path]"""
+    import argparse
+    parser = argparse.ArgumentParser(description="Reads the snipper "
+      "templates for all the vims on the host")
+    parser.add_argument("--socket", default=Daemon.defaultPath())
+    Daemon(parser.parse_args(args).socket).serve()
+
 class Snipper(object):
   """This class is the main class,
   when buffers are switched it makes sure the correct Buffer is called
@@ -168,23 +1134,41 @@ class Snipper(object):
 
   def __init__(self):
     self.helper = Helper()
-    self.template_files = self._readFiles()
-    self.buffers = {} 
+    folder = self.helper.getVariable("snipper_template_folder",
+      Snipper.template_folder)
+    catalog = (os.path.expanduser(folder),
+      self.helper.getVariable("snipper_aliases", {}),
+      self.helper.getVariable("snipper_extends", {}),
+      self.helper.getVariable("snipper_lazy_templates", "0") != "0",
+      self.helper.getVariable("snipper_store", "0") != "0")
+    daemon = self.helper.getVariable("snipper_daemon", "0")
+    if daemon == "0":
+      self.catalog = Catalog(*catalog)
+    else:
+      if daemon == "1":
+        daemon = Daemon.defaultPath()
+      self.catalog = RemoteCatalog(os.path.expanduser(daemon), *catalog)
+    if self.helper.getVariable("snipper_preload", "0") != "0":
+      self.catalog.preload(self.helper.tab)
+    self.buffers = {}
+    self.templates = {}
+    self.filetypes = set()
+    self.lazy = self.helper.getVariable("snipper_lazy_load", "1") != "0"
+    self.stats = Stats()
+    if self.helper.getVariable("snipper_stats", "0") != "0":
+      self.stats.enable()
 
   def registerBuffer(self):
-    """Registers a new buffer depending on the filetype
+    """Registers a new buffer depending on the filetype, when loading lazy the
+    templates are only read on the first trigger of the filetype
     """
     self.helper.detect()
     self.helper.log("register Buffer")
     filetype = self.helper.getFiletype() 
     if filetype:
-      try:
-        buffer = self._getBuffer(filetype)
-        self.buffers[filetype] = buffer
-        self.helper.log("buffer got registered for "+ filetype)
-      except NoTemplateFoundException:
-        self.helper.log("No template found for " + filetype)
-        self.buffers[filetype] = None 
+      self.filetypes.add(filetype)
+      if not self.lazy:
+        self._loadFiletype(filetype)
 
   def trigger(self):
     try:
@@ -195,22 +1179,51 @@ class Snipper(object):
       self.helper.log("main trigger insert tab")
       self.helper.insertTab()
 
+  def unregisterBuffer(self, number):
+    """Forgets the buffer with number, called when vim unloads it"""
+    self.buffers.pop(number, None)
+
   def _getCurrentBuffer(self):
+    """Returns the buffer of the current vim buffer, it uses the templates
+    of the current filetype
+    @raises NoTemplateFoundException
+    """
+    filetype = self.helper.getFiletype()
+    if filetype not in self.filetypes:
+      # The filetype was never registered, try redetecting the type 
+      self.registerBuffer()
+      filetype = self.helper.getFiletype()
+    if not filetype:
+      raise NoTemplateFoundException()
+    templates = self._loadFiletype(filetype)
+    if templates == None:
+      raise NoTemplateFoundException()
+    number = self.helper.getBuffer().number
     try:
-      buffer = self.buffers[self.helper.getFiletype()]
-      if buffer == None:
-        raise NoTemplateFoundException()
-      else:
-        return buffer
+      buffer = self.buffers[number]
+    except KeyError:
+      buffer = self.buffers[number] = Buffer(templates, self.helper)
+    # the filetype of a buffer can be changed
+    buffer.filetype = templates
+    return buffer
+
+  def _loadFiletype(self, filetype):
+    """Returns the templates shared by every buffer of filetype, they are
+    read the first time the filetype is asked for
+    """
+    try:
+      return self.templates[filetype]
     except KeyError:
-      # There is no buffer at hand for the current filetype, try redetecting the type 
-      self.registerBuffer()
       try:
-        self.buffers[self.helper.getFiletype()]
-        if buffer == None:
-          raise NoTemplateFoundException()
-      except:
-        raise NoTemplateFoundException()
+        templates = self._getFiletype(filetype)
+        self.helper.log("templates got read for %s", filetype)
+        self.helper.setTriggers(filetype, templates.index.triggers)
+      except NoTemplateFoundException:
+        self.helper.log("No template found for %s", filetype)
+        templates = None
+        self.helper.setTriggers(filetype, [])
+      self.templates[filetype] = templates
+      return templates
 
   def expand(self):
     """Just tries to expand the current template, if this fails, nothing is
@@ -231,69 +1244,154 @@ class Snipper(object):
       buffer.jump()
     except:
       pass
+
+  def complete(self, base):
+    """Sets g:snipper_completions to the completion items of the templates of
+    the current filetype that start with base"""
+    try:
+      templates = self._getCurrentBuffer().complete(base)
+    except NoTemplateFoundException:
+      templates = []
+    items = [{"word": trigger, "menu": description}
+      for (trigger, description) in templates]
+    self.helper.let("g:snipper_completions", items)
+
+  def expandRange(self, first, last, trigger):
+    """Handles :SnipperExpand, expands trigger or the trigger of every line
+    on the lines first up to last"""
+    try:
+      self._getCurrentBuffer().expandRange(first, last, trigger)
+    except NoTemplateFoundException:
+      pass
+
+  def mirror(self):
+    """Updates the mirrors of the placeholder being typed in, called while
+    typing so nothing is done when there is no template"""
+    try:
+      self._getCurrentBuffer().mirror()
+    except NoTemplateFoundException:
+      pass
+
+  def showStats(self, argument):
+    """Handles :SnipperStats, on and off start and stop the timing, reset
+    forgets the times, a file name writes the times to that file and
+    nothing prints them"""
+    if argument == "on":
+      self.stats.enable()
+    elif argument == "off":
+      self.stats.disable()
+    elif argument == "reset":
+      self.stats.reset()
+    elif argument:
+      out = open(os.path.expanduser(argument), "w")
+      out.write("\n".join(self.stats.report()) + "\n")
+      out.close()
+    else:
+      for line in self.stats.report():
+        print(line)
+
+  def listTemplates(self):
+    """Prints the templates of the current filetype"""
+    try:
+      templates = self._getCurrentBuffer().complete("")
+    except NoTemplateFoundException:
+      templates = []
+    for (trigger, description) in templates:
+      print(self.helper.encode("%-12s %s" % (trigger, description)))
+
+  def listAllTemplates(self):
+    """Prints the templates of all the template files"""
+    for name in self.catalog.names():
+      templates = self.catalog.read(name, self.helper.tab)
+      for trigger in TriggerIndex(templates).triggers:
+        print(self.helper.encode("%-8s %-12s %s" % (self.catalog.title(name),
+          trigger, templates[trigger][0])))
   
     
-  def _getBuffer(self, filetype):
+  def _getFiletype(self, filetype):
     """This file tries to search if there is a template file associated to
-    filetype, if so, create a new buffer and return that buffer, else,
-    raise an exception
+    filetype, if so, create a new Filetype and return it, else, raise an
+    exception
     @raises NoTemplateFoundException
     """
-    for file in self.template_files:
-      if filetype.lower() in file.lower():
-        bfile =  open(self.template_folder + "/" + file, 'r')
-        return Buffer(bfile) 
-
-    raise NoTemplateFoundException
+    tab = self.helper.tab
+    return Filetype(self.catalog.getTemplates(filetype, tab), tab)
+
+  def reload(self):
+    """Reads the template files that changed again and swaps them into the
+    filetypes using them, the active templates are left alone"""
+    changed = self.catalog.reload()
+    if not changed:
+      return
+    self.helper.log("reload %s", changed)
+    for (filetype, templates) in list(self.templates.items()):
+      try:
+        if templates == None:
+          # a new file may have templates for it
+          del self.templates[filetype]
+          self.helper.setTriggers(filetype, None)
+        elif set(changed) & set(self.catalog.lineage(filetype)):
+          templates.update(self.catalog.getTemplates(filetype, templates.tab))
+          self.helper.setTriggers(filetype, templates.index.triggers)
+      except (NoTemplateFoundException, EnvironmentError):
+        self.templates[filetype] = None
+        self.helper.setTriggers(filetype, [])
+      except (SyntaxError, expat.ExpatError):
+        # a template file saved half way, the templates read before stay
+        self.helper.error("reading the templates of %s failed: %s", filetype,
+          sys.exc_info()[1])
+
+class Filetype(object):
+  """This class contains the templates of a filetype, they are shared by all
+  the buffers of that filetype"""
+  def __init__(self, templates, tab):
+    """Creates a new Filetype
+    @param templates: the templates of the filetype, as read by TemplateFile
+    @param tab: the tab the templates were read with
+    """
+    self.tab = tab
+    self.update(templates)
 
-  def _readFiles(self):
-    """reads all the template files"""
-    template_files = []
-    for file in os.listdir(Snipper.template_folder):
-      if file.endswith(".xml"):
-        template_files.append(file)
-    return template_files
+  def update(self, templates):
+    """Replaces the templates, an active template keeps its own copy"""
+    self.templates = templates
+    self.index = TriggerIndex(self.templates)
 
 class Buffer(object):
-  """This class contains the templates of a buffer"""
-  def __init__(self, file):
+  """This class contains the active template of one vim buffer, the templates
+  come from the filetype of the buffer. A template expanded in the active one
+  suspends it, the suspended templates are kept on a stack until the
+  template expanded in them is done"""
+  def __init__(self, filetype, helper):
     """Creates a new Buffer
-    @param file: the file where all the snippets are
+    @param filetype: the Filetype with the templates of the buffer
+    @param helper: the helper shared with snipper
     """
-    self.helper = Helper()
-    self.file = file
-    self.templates = self._readTemplate(file)
-    self.helper = Helper()
+    self.helper = helper
+    self.filetype = filetype
     self.active = None
+    self.suspended = []
+    self.flagged = None
     self.previousPos = 0
     self.previousPos = ""
 
-  def _readTemplate(self, file):
-    """This reads the template in and returns a dict with the trigger as key and
-    the template as value"""
-    templates = {}
-    doc = ElementTree.parse(file)
-    entries = doc.findall("entry")
-    for entry in entries:
-      templates[entry.find("trigger").text] = [entry.find("description").text,
-      entry.find("template").text]
-    self._convertTabs(templates)
-    return templates
-
   def _highlightPattern(self, pattern):
     com = "match Visual /" + pattern + "/"
     vim.command(com)
 
-  def _convertTabs(self, templates):
-    for template in templates.values():
-      template[1] = template[1].replace("\t", self.helper.tab)
-
   def trigger(self):
     #TODO ugly!
     #here small bug
     #if you move and try to insert a new template, the previous must close and
     #the new one must get expanded
     #this is wrong with the if self.active.pos == ...
+    try:
+      self._resume()
+      self._trigger()
+    finally:
+      self._flagActive()
+
+  def _trigger(self):
     try:
       (word, line, pos, linenb) = self._readTemplateTrigger()
     except NoWordFoundException:
@@ -304,21 +1402,33 @@ class Buffer(object):
         if self.hasActive():
           #if there is a template word out of the range of the active
           #close the current active and open a new active
+          #a template word typed at the start of a line in a placeholder of
+          #the active is expanded in the active
           if self._isTrigger(word):
             if not self.active.inRange(linenb):
-              self._expand(word,line,pos)
+              self._expand(word, line, pos, linenb)
+            elif line[:pos[0]].strip() == "" and \
+              self.active.isTyped(linenb-1, pos[0]+pos[1]):
+              self._expand(word, line, pos, linenb)
             else:
               self.active.jump()
           else:
             self.active.jump()
         else:
-          self._expand(word, line, pos)
+          self._expand(word, line, pos, linenb)
       except NoTemplateFoundException:
         self.helper.insertTab()
       except NoMorePlaceHoldersException:
         self.helper.insertTab()
         self._closeActive()
 
+  def _flagActive(self):
+    """Tells vim if there is an active template, only when that changed"""
+    active = self.hasActive() or len(self.suspended) > 0
+    if active != self.flagged:
+      self.helper.setActive(active)
+      self.flagged = active
+
   def hasActive(self):
     if self.active == None:
       return False
@@ -333,77 +1443,308 @@ class Buffer(object):
     if any, is closed
     This method is needed for if you want a standalone expand button
     """
-    (word, line, pos, linenb) = self._readTemplateTrigger()
-    self._expand(word, line, pos)
+    try:
+      self._resume()
+      (word, line, pos, linenb) = self._readTemplateTrigger()
+      self._expand(word, line, pos, linenb)
+    finally:
+      self._flagActive()
 
   def jump(self):
     """Tries to jump,
     this method is needed if you want a standalone expand button
     """
-    self.active.jump()
-
-  def _expand(self, word, line, pos):
+    try:
+      self._resume()
+      self.active.jump()
+    finally:
+      self._flagActive()
+
+  def mirror(self):
+    """Updates the mirrors of the placeholder being typed in"""
+    if self.active is not None:
+      self.active.mirror()
+
+  def _expand(self, word, line, pos, linenb):
+    """Expands the template of word on line linenb, the templates linenb is
+    not in are closed and the innermost one it is in gets suspended"""
     self.helper.log("start expanding")
-    self._closeActive()
+    while self.active is not None and not (self.active.isActive() and
+      self.active.inRange(linenb)):
+      self._closeActive()
+    outer = self.active
     self.active = self._expandTemplate(word, line, pos)
+    if outer is not None:
+      outer.suspend(self.active)
+      self.suspended.append(outer)
     self.helper.log("stop expanding")
+
+  def expandRange(self, first, last, trigger):
+    """Expands trigger at the end of the lines first up to last, or the
+    trigger every line ends with if trigger is empty, and jumps to the first
+    placeholder. The lines are written together with that jump. A trigger
+    that is given is put after a space on a line that does not end with
+    whitespace, so it is never glued to the last word of the line
+    @raises NoTemplateFoundException
+    """
+    try:
+      while self.active is not None:
+        self._closeActive()
+      buffer = self.helper.getBuffer()
+      templates = self.filetype.templates
+      copies = []
+      for row in xrange(first-1, last):
+        line = buffer[row]
+        if trigger:
+          if line != "" and not line[-1].isspace():
+            line += " "
+          line += trigger
+          word = trigger
+        elif line.strip() == "" or line[-1].isspace():
+          word = None
+        else:
+          word = self._findTrigger(line)
+        if word in templates:
+          (description, lines, placeholders) = templates[word]
+          pos = (len(line)-len(word), len(word))
+          copies.append((lines, word, line, pos, placeholders))
+        else:
+          copies.append(None)
+      self.active = Template.batch(copies, first-1, self.helper)
+      if self.active is None:
+        raise NoTemplateFoundException()
+      try:
+        self.active.jump()
+      except NoMorePlaceHoldersException:
+        self._closeActive()
+    finally:
+      self._flagActive()
+
+  def _resume(self):
+    """Closes the active template when it is done and it was expanded in
+    another one, that one becomes active again"""
+    while self.suspended and not self.active.isActive():
+      self._closeActive()
       
   def _readTemplateTrigger(self):
     (row, col) = vim.current.window.cursor
     col = col+1
     line = vim.current.line
     lline = line[0:col]
-    #read untill white space
-    if col == 1 or lline.strip() == "" or lline[-1].isspace() or lline[-2].isspace():
+    if col == 1 or lline.strip() == "" or lline[-1].isspace():
       self.helper.log("_readTemplateTrigger found empty line")
       raise NoWordFoundException()
     else:
-      word = lline.split()[-1]
+      word = self._findTrigger(lline)
       pos = (col-len(word), len(word))
       return (word, line, pos, row)
 
+  def _findTrigger(self, line):
+    """Returns the longest trigger line ends with, only the last characters
+    of the line up to the length of the longest trigger are read. A trigger
+    starts after white space or where word characters and other characters
+    meet, so a trigger like . works right after a word. Without a trigger
+    the characters read are returned"""
+    end = len(line)
+    limit = max(0, end - self.filetype.index.longest)
+    start = end
+    while start > limit and not line[start-1].isspace():
+      start -= 1
+    templates = self.filetype.templates
+    for first in range(start, end):
+      if first == 0 or line[first-1].isspace() or \
+        self._isWord(line[first-1]) != self._isWord(line[first]):
+        if line[first:end] in templates:
+          return line[first:end]
+    return line[start:end]
+
+  def _isWord(self, char):
+    return char.isalnum() or char == "_"
+
     
   def _isTrigger(self, word):
     try:
-      self.templates[word]
+      self.filetype.templates[word]
       return True
     except KeyError:
       return False
 
+  def complete(self, prefix):
+    """Returns (trigger, description) for every template whose trigger
+    starts with prefix"""
+    templates = self.filetype.templates
+    return [(trigger, templates[trigger][0])
+      for trigger in self.filetype.index.complete(prefix)]
+
   def _expandTemplate(self, word, line, pos):
     """tries to insert the template, if the template does not exist, insert a
     tab
     @pre  There exists a template file
     """
     try:
-      template =  self.templates[word][1]
-      return Template(template, word, line, pos)
+      (description, lines, placeholders) = self.filetype.templates[word]
+      return Template(lines, word, line, pos, placeholders, self.helper)
     except KeyError:
       raise NoTemplateFoundException()
 
   def _closeActive(self):
-    """Closes the active template"""
+    """Closes the active template, the template it was expanded in becomes
+    active again"""
     try:
       self.active.close()
-      self.active = None
     except:
       # If there is no active then nothing needs to be closed
       pass
+    self.active = None
+    if self.suspended:
+      self.active = self.suspended.pop()
 
     
+class Edit(object):
+  """This class collects the changed lines of one expand, jump or close, so
+  they get written to the vim buffer with one slice assignment. Reading a
+  line gives the changed line if there is one, the rows are those after the
+  splice that is not written yet
+  """
+  __slots__ = ("buffer", "lines", "spliced")
+
+  def __init__(self, buffer):
+    self.buffer = buffer
+    self.lines = {}
+    self.spliced = None
+
+  def __len__(self):
+    if self.spliced is None:
+      return len(self.buffer)
+    (first, last, lines) = self.spliced
+    return len(self.buffer) + len(lines) - (last - first)
+
+  def __getitem__(self, row):
+    try:
+      return self.lines[row]
+    except KeyError:
+      pass
+    if self.spliced is None:
+      return self.buffer[row]
+    (first, last, lines) = self.spliced
+    if row < first:
+      return self.buffer[row]
+    elif row < first + len(lines):
+      return lines[row - first]
+    else:
+      return self.buffer[row - len(lines) + last - first]
+
+  def __setitem__(self, row, line):
+    self.lines[row] = line
+
+  def splice(self, first, last, lines):
+    """Replaces the lines first up to last by lines, they are written with
+    the changed lines"""
+    self.flush()
+    self.spliced = (first, last, list(lines))
+
+  def flush(self):
+    """Writes the changed lines to the vim buffer"""
+    if self.spliced is not None:
+      (first, last, lines) = self.spliced
+      start = min(list(self.lines) + [first])
+      end = max(list(self.lines) + [first + len(lines) - 1])
+      new = [self[k] for k in range(start, end+1)]
+      self.buffer[start:end + 1 - len(lines) + last - first] = new
+      self.spliced = None
+      self.lines = {}
+    elif self.lines:
+      first = min(self.lines)
+      last = max(self.lines)
+      self.buffer[first:last+1] = [self[k] for k in range(first, last+1)]
+      self.lines = {}
+
+  def flushRows(self):
+    """Writes only the changed lines to the vim buffer, a run of changed
+    lines next to each other is written with one slice assignment"""
+    if self.spliced is not None:
+      self.flush()
+      return
+    rows = sorted(self.lines)
+    while rows:
+      first = last = rows.pop(0)
+      while rows and rows[0] == last + 1:
+        last = rows.pop(0)
+      self.buffer[first:last+1] = [self.lines[k] for k in range(first, last+1)]
+    self.lines = {}
+
 class Template(object):
   """This is the class that contains one template"""
-  def __init__(self, template, word, line, pos):
-    self.helper = Helper()
+  __slots__ = ("helper", "line", "row", "buffer", "pos", "word", "indent",
+    "after", "mirrors", "current", "placeholders", "start", "end", "mark")
+
+  def __init__(self, template, word, line, pos, placeholders, helper):
+    """Creates and expands a new template
+    @param template: the lines of the template
+    @param placeholders: the placeholders of the template in the order they
+    are visited, as compiled by TemplateFile
+    @param helper: the helper shared with snipper
+    """
+    self.helper = helper
     self.line = line
     self.row = self.helper.row()
-    self.buffer = self.helper.getBuffer()
+    self.buffer = Edit(self.helper.getBuffer())
     self.pos = pos
-    self.template = template
     self.word = word
-    self.template_list = self._formatTemplate(line, pos, word)
-    self.placeholders = self._getAllPlaceholders(self.template_list)
-    self._expand(self.template_list)
+    (row, col) = vim.current.window.cursor
+    (lines, offsets) = self._formatTemplate(template, placeholders, line, pos,
+      col-len(word))
+    self.mirrors = []
+    self.current = None
+    self.placeholders = self._getAllPlaceholders(offsets, self.row-1, pos)
+    self._expand(lines)
+    self.start = self.row-1
+    self.end = self.start + len(lines) - 1
+    self._mark(self.row-1, 0)
+    self.buffer.flush()
+
+  @classmethod
+  def batch(cls, copies, first, helper):
+    """Creates and expands a template on every line from first on, the lines
+    are written at once. The placeholders of the first line are visited
+    first
+    @param copies: (template, word, line, pos, placeholders) as they are
+    given to a new Template for every line, None leaves the line alone
+    @param first: the buffer line of the first copy
+    @param helper: the helper shared with snipper
+    @return None if there was nothing to expand
+    """
+    if not [copy for copy in copies if copy is not None]:
+      return None
+    self = object.__new__(cls)
+    self.helper = helper
+    self.row = first + 1
+    self.buffer = Edit(helper.getBuffer())
+    self.mirrors = []
+    self.current = None
+    lines = []
+    placeholders = []
+    # the lines are one expansion, a variable is asked for once for all
+    values = {}
+    for (k, copy) in enumerate(copies):
+      if copy is None:
+        lines.append(self.buffer[first + k])
+        continue
+      (template, word, line, pos, offsets) = copy
+      (expanded, offsets) = self._formatTemplate(template, offsets, line, pos,
+        pos[0]-1, values)
+      placeholders.append(self._getAllPlaceholders(offsets,
+        first + len(lines), pos))
+      lines.extend(expanded)
+      (self.line, self.pos, self.word) = (line, pos, word)
+    self.placeholders = []
+    for part in reversed(placeholders):
+      self.placeholders.extend(part)
+    self.buffer.splice(first, first + len(copies), lines)
+    self.start = first
+    self.end = first + len(lines) - 1
+    self._mark(first, 0)
+    return self
 
   def isActive(self):
     if len(self.placeholders) > 0:
@@ -413,12 +1754,9 @@ class Template(object):
 
   def equals(self, word, line, pos):
     self.helper.log("check if equals to")
-    posLog = "pos self " + str(self.pos) + " == " + str(pos)
-    lineLog = "line self " + self.line + " == " + str(line)
-    wordLog = "word self " + self.word + " == " + str(word)
-    self.helper.log(posLog)
-    self.helper.log(lineLog)
-    self.helper.log(wordLog)
+    self.helper.log("pos self %s == %s", self.pos, pos)
+    self.helper.log("line self %s == %s", self.line, line)
+    self.helper.log("word self %s == %s", self.word, word)
 
     if self.isActive() and self.pos == pos and self.word == word:
       self.helper.log("active is equal")
@@ -429,6 +1767,7 @@ class Template(object):
 
   def jump(self):
     """Jumps to the next placeholder"""
+    self._sync()
     while self.isActive():
       try:
         placeholder = self.placeholders.pop()
@@ -436,34 +1775,171 @@ class Template(object):
       except PlaceholderNotFoundException:
         continue
       else:
-        line = self.buffer[pos[0]]
-        new_line = self._insertText(line, pos, "") 
+        self._replace(pos, "")
+        for mirror in placeholder.mirrors:
+          self._mirror(mirror, "")
+        self.current = placeholder
+        self.helper.setMirroring(len(placeholder.mirrors) > 0)
+        self.buffer.flush()
         cursor = (pos[0]+1, pos[1])
         vim.current.window.cursor = cursor
         vim.command("startinsert")
         self.helper.redraw()
-        self.buffer[pos[0]] = new_line
         return
     else:
       raise NoMorePlaceHoldersException()
 
+  def mirror(self):
+    """Copies the text typed in the current placeholder to its mirrors, only
+    the lines of the mirrors are written"""
+    current = self.current
+    if current is None or not current.mirrors:
+      return
+    self._sync()
+    (row, col, length, lines, text, before) = self.mark
+    if row != current.row or col < current.col:
+      # a new line was typed, mirrors only follow one line
+      self.current = None
+      self.helper.setMirroring(False)
+      return
+    text = self.buffer[row][current.col:col]
+    for mirror in current.mirrors:
+      self._mirror(mirror, text)
+    self.buffer.flushRows()
+
+  def isTyped(self, row, col):
+    """Checks if the text in front of row and col was typed in the current
+    placeholder"""
+    self._sync()
+    return self.current is not None and self.mark[:2] == (row, col)
+
+  def suspend(self, inner):
+    """Suspends this template while the template inner, expanded in it at
+    the mark, is active. The edits of inner are all done in front of the
+    text behind inner, so that is where the mark goes"""
+    self._sync()
+    row = inner.end
+    self._mark(row, len(self.buffer[row]) - inner.after)
+
+  def _mirror(self, mirror, text):
+    """Writes text over the current text of mirror, a mirror that still holds
+    its placeholder but moved is searched for, a mirror that was edited by
+    hand is left alone"""
+    (row, col) = (mirror.row, mirror.col)
+    line = self._lineAt(row)
+    if line is None or line[col:col+len(mirror.text)] != mirror.text:
+      if mirror.text != str(mirror):
+        return
+      try:
+        (row, col, length) = self._searchPlaceholder(mirror)
+      except PlaceholderNotFoundException:
+        return
+      (mirror.row, mirror.col) = (row, col)
+      line = self.buffer[row]
+    self.buffer[row] = line[:col] + text + line[col+len(mirror.text):]
+    delta = len(text) - len(mirror.text)
+    mirror.text = text
+    self._shift(row, col, delta)
+    (mrow, mcol, length, lines, marked, before) = self.mark
+    if mrow == row:
+      if col < mcol:
+        mcol += delta
+      self.mark = (mrow, mcol, length + delta, lines, self.buffer[row], before)
+
   def _insertText(self, line, pos, text):
     nl = line[:pos[1]] + text + line[pos[1]+pos[2]:]
     return nl  
 
-  def _placeCursors(self, placeholders):
-    return [x for x in placeholders if x == self.cursor] + [x for x in placeholders if x != self.cursor] 
+  def _replace(self, pos, text):
+    """Replaces the placeholder at pos with text and moves the placeholders
+    behind it on the same line along"""
+    (row, col, length) = pos
+    self.buffer[row] = self._insertText(self.buffer[row], pos, text)
+    self._shift(row, col, len(text) - length)
+    self._mark(row, col + len(text))
+
+  def _shift(self, row, col, delta):
+    """Moves the placeholders on row behind col delta columns"""
+    for placeholder in self.placeholders + self.mirrors:
+      if placeholder.row == row and placeholder.col > col:
+        placeholder.col += delta
+
+  def _mark(self, row, col):
+    """Remembers where the user will edit next, everything on row after col
+    keeps its distance to the end of the line while typing. The text of row
+    and of the line before it tells if lines were added or removed somewhere
+    else"""
+    line = self.buffer[row]
+    before = None
+    if row > 0:
+      before = self.buffer[row - 1]
+    self.mark = (row, col, len(line), len(self.buffer), line, before)
+
+  def _sync(self):
+    """Moves the tracked placeholders along with the edits done since the
+    last mark, the edits are expected to be done at the mark"""
+    (row, col, length, lines, text, before) = self.mark
+    delta = len(self.buffer) - lines
+    try:
+      if delta == 0 and len(self.buffer[row]) == length:
+        return
+      # a new line typed at the mark splits its line or puts the cursor on
+      # the new line, else the lines were added or removed somewhere else
+      if (delta != 0 and before is not None and
+        self._lineAt(row + delta) == text and self._lineAt(row - 1) != before):
+        # in front of the template, it moves along as a whole
+        for placeholder in self.placeholders + self.mirrors:
+          placeholder.row += delta
+        self.start += delta
+        self.end += delta
+        self._mark(row + delta, col)
+        return
+      typed = row < vim.current.window.cursor[0] - 1 <= row + delta
+      if delta != 0 and self._lineAt(row) == text and not typed:
+        # behind the mark, the template keeps its place
+        self._mark(row, col)
+        return
+      tail = row + delta
+      for placeholder in self.placeholders + self.mirrors:
+        if placeholder.row > row:
+          placeholder.row += delta
+        elif placeholder.row == row and placeholder.col >= col:
+          placeholder.row = tail
+          placeholder.col = len(self.buffer[tail]) - (length - placeholder.col)
+      self._mark(tail, len(self.buffer[tail]) - (length - col))
+      self.end += delta
+    except IndexError:
+      # the edit did not happen at the mark, _findPlaceholder will search
+      pass
   
+  def _lineAt(self, row):
+    """Returns line row of the buffer, None if there is no such line"""
+    if 0 <= row < len(self.buffer):
+      return self.buffer[row]
+    return None
+
   def _findPlaceholder(self, placeholder):
-    """searches the position of the first placeholder found"""
-    start = self.row
-    for lineno in xrange(start-1, len(self.buffer)):
-      x = self.buffer[lineno].find(str(placeholder))
-      if x != -1:
-        return (lineno, x, len(placeholder))
-    #not found after, search to start backwords!
-    for lineno in xrange(start-1, 0, -1):
-      x = self.buffer[lineno].find(str(placeholder))
+    """Returns the position of placeholder, the tracked position is used when
+    it still holds the placeholder, else the buffer is searched"""
+    self._sync()
+    text = str(placeholder)
+    row = placeholder.row
+    col = placeholder.col
+    if 0 <= row < len(self.buffer) and col >= 0:
+      if self.buffer[row][col:col+len(text)] == text:
+        return (row, col, len(text))
+    pos = self._searchPlaceholder(placeholder)
+    placeholder.row = pos[0]
+    placeholder.col = pos[1]
+    return pos
+
+  def _searchPlaceholder(self, placeholder):
+    """searches the position of the first placeholder found in the lines of
+    this template, so nested templates do not search each others lines"""
+    (start, end) = self._getRange()
+    text = str(placeholder)
+    for lineno in xrange(max(start, 0), min(end + 1, len(self.buffer))):
+      x = self.buffer[lineno].find(text)
       if x != -1:
         return (lineno, x, len(placeholder))
     raise PlaceholderNotFoundException()
@@ -472,66 +1948,100 @@ class Template(object):
   def _expand(self, template_list):
     #TODO the row shouldn't be here?
     (row, col) = vim.current.window.cursor
-    buffer = self.helper.getBuffer()
-    buffer[row-1:row] = template_list
+    self.buffer.splice(row-1, row, template_list)
 
-  def inRange(self,linenb):
-    """Checks if pos is in the range of this template
+  def inRange(self, linenb):
+    """Checks if linenb is one of the lines of this template
     """
-    myRange = self._getRange()
-    if myRange == (-1, -1):
-      return False
-    if linenb > myRange[0] and linenb <= myRange[1]:
-      return True
-    else:
-      return False
+    self._sync()
+    (start, end) = self._getRange()
+    return start < linenb <= end + 1
 
   def _getRange(self):
-    """Gets the range of the current placeholders, if this is to slow,
-    don't use it"""
-    minPos = -1
-    maxPos = -1
-    for placeholder in self.placeholders:
-      try:
-        pos = self._findPlaceholder(placeholder)
-        if pos[0] > maxPos:
-          maxPos = pos[0]
-        if minPos == -1 or pos[0] < minPos:
-          minPos = pos[0]
-      except PlaceholderNotFoundException:
-        continue
-    return (minPos, maxPos)
-
-
-    
-  def _formatTemplate(self, line, pos, word):
-    (row, col) = vim.current.window.cursor
-    template = self.template
+    """Gets the first and the last line of the template, the lines added or
+    removed since the last mark are counted without looking at the buffer"""
+    return (self.start, self.end + len(self.buffer) - self.mark[3])
+
+  def _formatTemplate(self, template, offsets, line, pos, column,
+    values=None):
+    """Returns the lines of template expanded for the trigger at pos in line
+    and the offsets of its placeholders in these lines, the lines after the
+    first are indented as the trigger at column
+    @param values: the variables already filled in for this expansion
+    """
+    (lines, offsets) = self._fillVariables(template, offsets, values)
     before = line[0:pos[0]]
     after = line[pos[0]+pos[1]:]
-    template = before + template + after
-    template_list = template.split("\n")
-    new_list = []
-    new_list.append(template_list[0])
-    for template in template_list[1:]:
-      new_list.append(self.helper.addTabs(template, col-len(word)))
-    return new_list 
+    self.after = len(after)
+    self.indent = self.helper.addTabs("", column)
+    new_list = [before + lines[0]]
+    for template in lines[1:]:
+      new_list.append(self.indent + template)
+    new_list[-1] += after
+    return (new_list, offsets)
     #template inserted, now go to template mode with and cycle with tabs
     #set autocommand for insert mode
     #vim.command('norm "\<C-\\>\<C-N>"') 
     #vim.command("startinsert")
-    #vim.command("autocmd CursorMovedI * python template.trigger()")
+    #vim.command("autocmd CursorMovedI * pythonx template.trigger()")
 
-  def _getAllPlaceholders(self, template_list):
-    """Return all the placeholders"""
-    tmp = []
+  def _fillVariables(self, lines, offsets, values=None):
+    """Fills in the built in placeholders, returns the new lines and the
+    offsets of the other placeholders in these lines
+    @param values: the variables already filled in for this expansion, a
+    variable is only asked for once
+    """
+    variables = self.helper.variables
+    for (lineno, col, placeholder) in offsets:
+      if placeholder in variables:
+        break
+    else:
+      return (lines, offsets)
+    if values is None:
+      values = {}
+    byline = {}
+    for offset in offsets:
+      byline.setdefault(offset[0], []).append(offset)
+    new_lines = []
+    moved = {}
+    for (lineno, line) in enumerate(lines):
+      text = ""
+      last = 0
+      for offset in sorted(byline.get(lineno, []), key=lambda k: k[1]):
+        (lineno, col, placeholder) = offset
+        text += line[last:col]
+        if placeholder in variables:
+          value = variables.resolve(placeholder, values).split("\n")
+          for part in value[:-1]:
+            new_lines.append(text + part)
+            text = ""
+          text += value[-1]
+        else:
+          moved[offset] = (len(new_lines), len(text), placeholder)
+          text += placeholder
+        last = col + len(placeholder)
+      new_lines.append(text + line[last:])
+    return (new_lines, [moved[k] for k in offsets if k in moved])
+
+  def _getAllPlaceholders(self, offsets, row, pos):
+    """Return all the placeholders, placed in the buffer from their offsets in
+    the template expanded on row, the next one to visit is the last one. A
+    placeholder with the same name as an earlier one becomes a mirror of that
+    one"""
     placeholders = []
-    for line in template_list:
-      found = re.findall(Placeholder.pattern, line)
-      tmp.extend(found)
-    for placeholder in tmp:
-      placeholders.append(Placeholder(placeholder))
-    placeholders.sort()
+    first = {}
+    for (lineno, col, placeholder) in offsets:
+      if lineno == 0:
+        col += pos[0]
+      else:
+        col += len(self.indent)
+      found = Placeholder.compiled(placeholder, row + lineno, col)
+      if placeholder in first and placeholder != Placeholder.cursor:
+        first[placeholder].mirrors.append(found)
+        self.mirrors.append(found)
+      else:
+        first[placeholder] = found
+        placeholders.append(found)
     placeholders.reverse()
     return placeholders
 
@@ -542,11 +2052,109 @@ class Template(object):
     for placeholder in self.placeholders:
       try:
         pos = self._findPlaceholder(placeholder)
-        line = self.buffer[pos[0]]
-        new_line = self._insertText(line, pos, placeholder.value()) 
-        self.buffer[pos[0]] = new_line
+        self._replace(pos, placeholder.value())
+        for mirror in placeholder.mirrors:
+          self._mirror(mirror, placeholder.value())
       except PlaceholderNotFoundException:
         continue
+    self.current = None
+    self.helper.setMirroring(False)
+    self.buffer.flush()
     self.helper.redraw()
 
-snipper = Snipper()
+class Histogram(object):
+  """This class keeps the count and the maximum of a timer and its most
+  recent times, the percentiles are taken from these"""
+  size = 1024
+
+  def __init__(self):
+    self.clear()
+
+  def clear(self):
+    self.count = 0
+    self.max = 0.0
+    self.times = []
+
+  def add(self, seconds):
+    if self.count < Histogram.size:
+      self.times.append(seconds)
+    else:
+      self.times[self.count % Histogram.size] = seconds
+    self.count += 1
+    if seconds > self.max:
+      self.max = seconds
+
+  def percentile(self, percent):
+    ordered = sorted(self.times)
+    if not ordered:
+      return 0.0
+    return ordered[min(len(ordered) - 1, len(ordered) * percent // 100)]
+
+class Stats(object):
+  """This class times the methods a tab press goes through. Turning it on
+  wraps these methods in a timer and turning it off puts the methods back,
+  so it costs nothing while it is off
+  """
+  timed = {"Snipper": ["trigger", "expand", "jump", "mirror"],
+    "Buffer": ["trigger", "_readTemplateTrigger", "_expand", "_closeActive",
+      "_flagActive", "expandRange"],
+    "Template": ["jump", "close", "mirror", "inRange", "_getRange",
+      "_findPlaceholder", "_searchPlaceholder", "_sync"],
+    "Edit": ["flush", "flushRows", "splice"],
+    "Helper": ["readTabs", "getFiletype", "getVariable", "redraw",
+      "insertTab"]}
+  clock = getattr(time, "perf_counter", time.time)
+
+  def __init__(self):
+    self.histograms = {}
+    self.originals = {}
+
+  def enable(self):
+    """Starts timing"""
+    if self.originals:
+      return
+    for (name, methods) in Stats.timed.items():
+      cls = globals()[name]
+      for method in methods:
+        function = cls.__dict__[method]
+        self.originals[(cls, method)] = function
+        setattr(cls, method, self._timer(function, name + "." + method))
+
+  def disable(self):
+    """Stops timing, the times so far are kept"""
+    for ((cls, method), function) in self.originals.items():
+      setattr(cls, method, function)
+    self.originals = {}
+
+  def reset(self):
+    """Forgets the times, the timers that are on keep their histogram"""
+    for histogram in self.histograms.values():
+      histogram.clear()
+
+  def _timer(self, function, name):
+    histogram = self.histograms.setdefault(name, Histogram())
+    clock = Stats.clock
+    def timer(*args, **kwargs):
+      start = clock()
+      try:
+        return function(*args, **kwargs)
+      finally:
+        histogram.add(clock() - start)
+    return timer
+
+  def report(self):
+    """Returns the lines with count, p50, p99 and max in ms of every timer
+    that ran"""
+    lines = ["%-34s %8s %9s %9s %9s" % ("timer", "count", "p50", "p99", "max")]
+    for name in sorted(self.histograms.keys()):
+      histogram = self.histograms[name]
+      if histogram.count:
+        lines.append("%-34s %8d %9.3f %9.3f %9.3f" % (name, histogram.count,
+          histogram.percentile(50) * 1000, histogram.percentile(99) * 1000,
+          histogram.max * 1000))
+    return lines
+
+if vim is None:
+  Daemon.main(sys.argv[1:])
+else:
+  snipper = Snipper()
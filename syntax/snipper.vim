@@ -1,16 +1,125 @@
-" Reads the snipper file
-pyfile ~/.vim/snipper/src/snipper.py
+" Reads the snipper file with the python vim has, set 'pyxversion' in your
+" vimrc to choose between python 2 and 3 when vim has both
+pyxfile ~/.vim/snipper/src/snipper.py
 
-" maps the tab button to trigger snipper
-imap <tab> <C-o>:python snipper.trigger()<CR>
+" maps the tab button to trigger snipper, a tab only goes to snipper after
+" a trigger or while a template is active, every other tab stays a plain tab
+" snipper fills in the triggers of every filetype it read, a filetype that
+" is not in there yet goes to snipper
+if !exists("g:snipper_triggers")
+  let g:snipper_triggers = {'': {}}
+endif
+
+function! SnipperTab()
+  if exists('b:snipper_active') || !has_key(g:snipper_triggers, &ft)
+    return "\<C-o>:pythonx snipper.trigger()\<CR>"
+  endif
+  " a trigger can start where word characters and other characters meet
+  let word = matchstr(strpart(getline('.'), 0, col('.') - 1), '\S\+$')
+  while word != ''
+    if has_key(g:snipper_triggers[&ft], word)
+      return "\<C-o>:pythonx snipper.trigger()\<CR>"
+    endif
+    let word = substitute(word, '^\(\w\+\|\W\+\)', '', '')
+  endwhile
+  return "\<tab>"
+endfunction
+
+inoremap <expr> <tab> SnipperTab()
 
 
 "if you want to different buttons, one for expanding and one
 "for jumping between the placeholders use these mappings instead
 "and remove the snipper.trigger() map
-"imap <tab> <C-o>:python snipper.expand()<CR>
-"imap <F2> <C-o>:python snipper.jump()<CR>
+"imap <tab> <C-o>:pythonx snipper.expand()<CR>
+"imap <F2> <C-o>:pythonx snipper.jump()<CR>
+
+"lists the templates of the current filetype or of all the template files
+command! SnipperList pythonx snipper.listTemplates()
+command! SnipperListAll pythonx snipper.listAllTemplates()
+
+"expands a template on every line of a range or selection, ':SnipperExpand
+"fimp' expands fimp at the end of every line, after a space when the line
+"does not end with one, and ':SnipperExpand' expands the trigger every line
+"ends with, tab goes through the placeholders of all the lines
+"the trigger goes through a function, <q-args> is quoted for vim and not
+"for python
+function! SnipperExpand(first, last, trigger)
+  pythonx snipper.expandRange(int(vim.eval("a:first")), int(vim.eval("a:last")), vim.eval("a:trigger"))
+endfunction
+command! -range -nargs=? SnipperExpand call SnipperExpand(<line1>, <line2>, <q-args>)
+
+"times the tab key, ':SnipperStats on' starts and ':SnipperStats off' stops
+"the timing (or 'let g:snipper_stats = 1' in your vimrc), ':SnipperStats'
+"prints count, p50, p99 and max in ms, ':SnipperStats file' writes them to
+"file and ':SnipperStats reset' forgets them
+function! SnipperStats(argument)
+  pythonx snipper.showStats(vim.eval("a:argument"))
+endfunction
+command! -nargs=? -complete=file SnipperStats call SnipperStats(<q-args>)
+
+"completes the templates of the current filetype with their description, to
+"use it with <C-x><C-u> put 'set completefunc=SnipperComplete' in your vimrc
+function! SnipperComplete(findstart, base)
+  if a:findstart
+    let start = col('.') - 1
+    let line = getline('.')
+    while start > 0 && line[start - 1] =~ '\S'
+      let start -= 1
+    endwhile
+    return start
+  endif
+  pythonx snipper.complete(vim.eval("a:base"))
+  return g:snipper_completions
+endfunction
 
 "tries to read the filetype and load the correct template file
-autocmd BufRead * python snipper.registerBuffer()
-autocmd BufNewFile * python snipper.registerBuffer() 
+"a filetype uses the file with the same name in front of -templates.xml,
+"other filetypes can be mapped on a file with g:snipper_aliases and a file
+"can use the templates of other files with g:snipper_extends, for example
+"let g:snipper_aliases = {'mkd': 'html'}
+"let g:snipper_extends = {'php': ['html']}
+"the templates of a filetype are read on the first tab in a buffer of that
+"filetype, put 'let g:snipper_lazy_load = 0' in your vimrc to read them
+"when the buffer is opened
+"with 'let g:snipper_preload = 1' all the template files are read in the
+"background while vim starts
+"for very large template files 'let g:snipper_lazy_templates = 1' only reads
+"the triggers and descriptions, a template is read when it is expanded
+"with 'let g:snipper_store = 1' the templates are compiled into a store
+"beside each template file that is memory mapped and shared by every vim,
+"a template is only decoded when it is used
+"to read the template files once for all the vims on the host start the
+"daemon with 'python ~/.vim/snipper/src/snipper.py &' and put
+"'let g:snipper_daemon = 1' in your vimrc (or the path of its socket if it
+"was started with --socket path), without the daemon the templates are
+"read by vim itself. The socket is in $XDG_RUNTIME_DIR or a directory only
+"you can write in, vim only talks to a socket you own
+autocmd BufRead * pythonx snipper.registerBuffer()
+autocmd BufNewFile * pythonx snipper.registerBuffer() 
+
+"every buffer has its own active template, forget it when the buffer goes
+autocmd BufUnload * pythonx snipper.unregisterBuffer(int(vim.eval("expand('<abuf>')")))
+
+"template files that changed are read again when vim is idle, put
+"'let g:snipper_reload = 0' in your vimrc to turn this off
+autocmd CursorHold,CursorHoldI,FocusGained * if get(g:, 'snipper_reload', 1) | pythonx snipper.reload() | endif
+
+"placeholders with the same name as the one being typed in follow the typing
+if exists("##TextChangedI")
+  autocmd TextChangedI * if exists('b:snipper_mirror') | pythonx snipper.mirror() | endif
+endif
+
+"the tab settings are cached, read them again when they change
+autocmd BufEnter * pythonx snipper.helper.invalidate()
+if exists("##OptionSet")
+  autocmd OptionSet expandtab,smarttab,shiftwidth,tabstop pythonx snipper.helper.invalidate()
+endif
+
+"logging is off, to debug snipper put 'let g:snipper_log_level = "debug"' in
+"your vimrc, the log is written to g:snipper_log_file (~/.vim/snipper/log)
+
+"${date}, ${filename}, ${selection}, ${author} and ${clipboard} are filled
+"in when a template is expanded, ${selection} is the last visual selection,
+"the date uses g:snipper_date_format (%Y-%m-%d) and the author comes from
+"g:snipper_author or $USER
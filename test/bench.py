@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+# Copyright © 2005 Thomas Coopman
+#
+# This file is part of Snipper.
+#
+# Snipper is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Snipper is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snipper; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301
+# USA
+
+"""Times snipper outside vim, with the fake vim module next to this file.
+
+It times the parsing of every template file (without and with its cache)
+and expanding, jumping through, checking the range of and closing a
+template in buffers from 100 up to 100000 lines. The results are written
+as json, the times are the best of the repeats in milliseconds.
+
+  python test/bench.py [--repeat 5] [--sizes 100,1000] [--output file]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import argparse
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, here)
+import vim
+
+root = os.path.dirname(here)
+source = os.path.join(root, "src", "snipper-0.2.py")
+
+def load(folder):
+  """Runs the snipper source with the templates in folder and returns its
+  namespace"""
+  vim.variables["g:snipper_template_folder"] = folder
+  namespace = {"__name__": "snipper"}
+  code = open(source, "rb").read()
+  exec(compile(code, source, "exec"), namespace)
+  return namespace
+
+def best(function, repeat):
+  """Returns the fastest of repeat calls of function in milliseconds"""
+  times = []
+  for k in range(repeat):
+    start = time.time()
+    function()
+    times.append(time.time() - start)
+  return min(times) * 1000
+
+def typeText(text):
+  """Types text at the cursor like insert mode does"""
+  (row, col) = vim.current.window.cursor
+  line = vim.current.buffer[row-1]
+  vim.current.buffer[row-1] = line[:col] + text + line[col:]
+  vim.current.window.cursor = (row, col + len(text))
+
+def benchParse(snipper, folder, repeat):
+  """Times reading every template file without and with its cache"""
+  results = {}
+  TemplateFile = snipper["TemplateFile"]
+  tab = snipper["snipper"].helper.tab
+  for file in sorted(os.listdir(folder)):
+    if not file.endswith(".xml"):
+      continue
+    templates = TemplateFile(os.path.join(folder, file), tab)
+    parse = best(templates._parse, repeat)
+    templates.read()
+    results[file] = {"parse": parse, "cached": best(templates.read, repeat)}
+  return results
+
+def setBuffer(size, trigger):
+  """Makes a buffer of size lines with trigger in the middle, the cursor is
+  on the trigger"""
+  lines = ["x = %d" % n for n in range(size)]
+  lines[size // 2] = trigger
+  vim.setBuffer(lines, (size // 2 + 1, len(trigger)-1), 1, "bench.py")
+  del vim.commands[:]
+
+def benchBuffer(snipper, size, trigger, repeat):
+  """Times the snipper actions on one template in a buffer of size lines,
+  the template is expanded in the middle of the buffer"""
+  main = snipper["snipper"]
+  middle = size // 2
+  times = {"expand": [], "jump": [], "inRange": [], "close": []}
+  for k in range(repeat):
+    setBuffer(size, trigger)
+    start = time.time()
+    main.trigger()
+    times["expand"].append(time.time() - start)
+    buffer = main._getCurrentBuffer()
+    active = buffer.active
+    start = time.time()
+    for n in range(100):
+      active.inRange(middle + 1)
+    times["inRange"].append((time.time() - start) / 100)
+    jumps = []
+    while active.isActive():
+      start = time.time()
+      main.trigger()
+      jumps.append(time.time() - start)
+      typeText("value")
+    times["jump"].append(max(jumps or [0]))
+    # close a template that still has all its placeholders
+    setBuffer(size, trigger)
+    main.trigger()
+    buffer = main._getCurrentBuffer()
+    active = buffer.active
+    buffer.active = None
+    start = time.time()
+    active.close()
+    times["close"].append(time.time() - start)
+  result = {}
+  for (name, values) in times.items():
+    result[name] = min(values) * 1000
+  return result
+
+def main():
+  parser = argparse.ArgumentParser(description="Times snipper outside vim")
+  parser.add_argument("--repeat", type=int, default=5)
+  parser.add_argument("--sizes", default="100,1000,10000,100000")
+  parser.add_argument("--filetype", default="python")
+  parser.add_argument("--trigger", default="cls")
+  parser.add_argument("--output")
+  args = parser.parse_args()
+
+  folder = tempfile.mkdtemp()
+  try:
+    for file in os.listdir(os.path.join(root, "templates")):
+      if file.endswith(".xml"):
+        shutil.copy(os.path.join(root, "templates", file), folder)
+    vim.options["ft"] = args.filetype
+    snipper = load(folder)
+    results = {"python": sys.version.split()[0],
+      "parse": benchParse(snipper, folder, args.repeat), "buffers": {}}
+    for size in [int(k) for k in args.sizes.split(",")]:
+      results["buffers"][str(size)] = benchBuffer(snipper, size, args.trigger,
+        args.repeat)
+  finally:
+    shutil.rmtree(folder)
+
+  output = json.dumps(results, indent=2, sort_keys=True)
+  if args.output:
+    out = open(args.output, "w")
+    out.write(output + "\n")
+    out.close()
+  else:
+    print(output)
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+# Copyright © 2005 Thomas Coopman
+#
+# This file is part of Snipper.
+#
+# Snipper is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Snipper is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Snipper; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301
+# USA
+
+"""A stand-in for the vim module of vim's python interface, it has just
+enough of a buffer, a window, eval and command to run snipper outside vim.
+The options, variables and registers are plain dicts the caller can change.
+"""
+
+import os
+
+class Buffer(list):
+  """A vim buffer, a list of lines"""
+  def __init__(self, lines=None, number=1, name=""):
+    list.__init__(self, lines or [""])
+    self.number = number
+    self.name = name
+
+class Window(object):
+  """A vim window, the cursor is (row, col) with row starting at 1"""
+  def __init__(self, buffer):
+    self.buffer = buffer
+    self.cursor = (1, 0)
+
+class Current(object):
+  """vim.current, line is the line under the cursor"""
+  def __init__(self):
+    self.buffer = Buffer()
+    self.window = Window(self.buffer)
+
+  def _getLine(self):
+    return self.buffer[self.window.cursor[0]-1]
+
+  def _setLine(self, line):
+    self.buffer[self.window.cursor[0]-1] = line
+
+  line = property(_getLine, _setLine)
+
+current = Current()
+options = {"expandtab": "1", "smarttab": "0", "shiftwidth": "4",
+  "tabstop": "4", "ft": ""}
+variables = {}
+registers = {"+": "", "*": "", '"': ""}
+commands = []
+
+def setBuffer(lines, cursor=(1, 0), number=1, name=""):
+  """Makes a new current buffer with lines and puts the cursor on it"""
+  current.buffer = Buffer(lines, number, name)
+  current.window = Window(current.buffer)
+  current.window.cursor = cursor
+  return current.buffer
+
+def eval(expr):
+  """Evaluates the few expressions snipper asks for"""
+  if expr.startswith("&"):
+    return options[expr[1:]]
+  if expr.startswith("@"):
+    return registers.get(expr[1:], "")
+  if expr.startswith('exists("') and expr.endswith('")'):
+    return str(int(expr[8:-2] in variables))
+  if expr in variables:
+    return variables[expr]
+  if expr == 'expand("%:t")':
+    return os.path.basename(current.buffer.name)
+  if expr == "visualmode()":
+    return ""
+  if expr.startswith("getpos("):
+    return ["0", "0", "0", "0"]
+  raise ValueError("the fake vim can not evaluate %r" % expr)
+
+def command(cmd):
+  """Remembers the command, only let is carried out"""
+  commands.append(cmd)
+  if cmd.startswith("let "):
+    (name, value) = cmd[4:].split(" = ", 1)
+    variables[name] = value
+  elif cmd.startswith("unlet! "):
+    variables.pop(cmd[7:], None)